@@ -0,0 +1,327 @@
+/*
+ * native builder of inverted index binary dump, loaded with ctypes
+ *
+ * build: gcc -O2 -shared -fPIC -o _inverted_index.so _inverted_index.c
+ *
+ * build_index_file reads "doc_id<TAB>content" lines, splits content to
+ * lowercase ascii words (same as \w) and writes the struct_dump layout:
+ * number of words, (word size, word, documents count) for every word,
+ * padding to int32 and all sorted posting lists as one int32 block.
+ * Non-ascii or malformed input is reported with BUILD_UNSUPPORTED, so
+ * the caller can fall back to the python builder.
+ */
+#define _POSIX_C_SOURCE 200809L
+
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+enum {
+    BUILD_OK = 0,
+    BUILD_IO_ERROR = 1,
+    BUILD_UNSUPPORTED = 2,
+    BUILD_NO_MEMORY = 3,
+};
+
+typedef struct {
+    char *word;
+    uint32_t size;
+    uint64_t hash;
+    int32_t *documents;
+    uint32_t count;
+    uint32_t capacity;
+} posting_t;
+
+typedef struct {
+    posting_t *postings;  /* in order of first appearance */
+    size_t count;
+    size_t capacity;
+    size_t *slots;        /* posting index + 1, zero for empty slot */
+    size_t slots_size;    /* power of two */
+} index_t;
+
+static unsigned char word_table[256];
+
+static void init_word_table(void)
+{
+    for (int byte = 0; byte < 256; byte++) {
+        if (byte >= 'A' && byte <= 'Z') {
+            word_table[byte] = (unsigned char)(byte - 'A' + 'a');
+        } else if ((byte >= 'a' && byte <= 'z')
+                   || (byte >= '0' && byte <= '9') || byte == '_') {
+            word_table[byte] = (unsigned char)byte;
+        } else {
+            word_table[byte] = 0;
+        }
+    }
+}
+
+static uint64_t fnv1a(const char *word, size_t size)
+{
+    uint64_t hash = 14695981039346656037ULL;
+    for (size_t i = 0; i < size; i++) {
+        hash ^= (unsigned char)word[i];
+        hash *= 1099511628211ULL;
+    }
+    return hash;
+}
+
+static int index_init(index_t *index)
+{
+    index->count = 0;
+    index->capacity = 1024;
+    index->postings = malloc(index->capacity * sizeof(posting_t));
+    index->slots_size = 2048;
+    index->slots = calloc(index->slots_size, sizeof(size_t));
+    return index->postings && index->slots ? BUILD_OK : BUILD_NO_MEMORY;
+}
+
+static void index_free(index_t *index)
+{
+    for (size_t i = 0; i < index->count; i++) {
+        free(index->postings[i].word);
+        free(index->postings[i].documents);
+    }
+    free(index->postings);
+    free(index->slots);
+}
+
+static int index_grow_slots(index_t *index)
+{
+    size_t slots_size = index->slots_size * 2;
+    size_t *slots = calloc(slots_size, sizeof(size_t));
+    if (!slots) {
+        return BUILD_NO_MEMORY;
+    }
+    for (size_t i = 0; i < index->count; i++) {
+        size_t slot = index->postings[i].hash & (slots_size - 1);
+        while (slots[slot]) {
+            slot = (slot + 1) & (slots_size - 1);
+        }
+        slots[slot] = i + 1;
+    }
+    free(index->slots);
+    index->slots = slots;
+    index->slots_size = slots_size;
+    return BUILD_OK;
+}
+
+static posting_t *index_get(index_t *index, const char *word, size_t size)
+{
+    uint64_t hash = fnv1a(word, size);
+    size_t slot = hash & (index->slots_size - 1);
+    while (index->slots[slot]) {
+        posting_t *posting = &index->postings[index->slots[slot] - 1];
+        if (posting->hash == hash && posting->size == size
+                && memcmp(posting->word, word, size) == 0) {
+            return posting;
+        }
+        slot = (slot + 1) & (index->slots_size - 1);
+    }
+
+    if (index->count == index->capacity) {
+        size_t capacity = index->capacity * 2;
+        posting_t *postings = realloc(index->postings,
+                                      capacity * sizeof(posting_t));
+        if (!postings) {
+            return NULL;
+        }
+        index->postings = postings;
+        index->capacity = capacity;
+    }
+    posting_t *posting = &index->postings[index->count];
+    posting->word = malloc(size);
+    if (!posting->word) {
+        return NULL;
+    }
+    memcpy(posting->word, word, size);
+    posting->size = (uint32_t)size;
+    posting->hash = hash;
+    posting->documents = NULL;
+    posting->count = 0;
+    posting->capacity = 0;
+    index->slots[slot] = ++index->count;
+
+    if (index->count * 2 > index->slots_size
+            && index_grow_slots(index) != BUILD_OK) {
+        return NULL;
+    }
+    return &index->postings[index->count - 1];
+}
+
+static int posting_append(posting_t *posting, int32_t doc_id)
+{
+    /* words repeated inside one document hit the last document */
+    if (posting->count && posting->documents[posting->count - 1] == doc_id) {
+        return BUILD_OK;
+    }
+    if (posting->count == posting->capacity) {
+        uint32_t capacity = posting->capacity ? posting->capacity * 2 : 4;
+        int32_t *documents = realloc(posting->documents,
+                                     capacity * sizeof(int32_t));
+        if (!documents) {
+            return BUILD_NO_MEMORY;
+        }
+        posting->documents = documents;
+        posting->capacity = capacity;
+    }
+    posting->documents[posting->count++] = doc_id;
+    return BUILD_OK;
+}
+
+static int compare_documents(const void *left, const void *right)
+{
+    int32_t a = *(const int32_t *)left;
+    int32_t b = *(const int32_t *)right;
+    return (a > b) - (a < b);
+}
+
+static void posting_finalize(posting_t *posting)
+{
+    /* documents may come in any order or repeat in the dataset */
+    qsort(posting->documents, posting->count, sizeof(int32_t),
+          compare_documents);
+    uint32_t count = 0;
+    for (uint32_t i = 0; i < posting->count; i++) {
+        if (!count || posting->documents[count - 1] != posting->documents[i]) {
+            posting->documents[count++] = posting->documents[i];
+        }
+    }
+    posting->count = count;
+}
+
+static int parse_doc_id(const char *line, size_t size, int32_t *doc_id,
+                        size_t *content_start)
+{
+    const char *tab = memchr(line, '\t', size);
+    if (!tab || tab == line) {
+        return BUILD_UNSUPPORTED;
+    }
+    const char *cursor = line;
+    int negative = 0;
+    if (*cursor == '-' || *cursor == '+') {
+        negative = *cursor == '-';
+        cursor++;
+    }
+    if (cursor == tab) {
+        return BUILD_UNSUPPORTED;
+    }
+    int64_t value = 0;
+    for (; cursor < tab; cursor++) {
+        if (*cursor < '0' || *cursor > '9') {
+            return BUILD_UNSUPPORTED;
+        }
+        value = value * 10 + (*cursor - '0');
+        if (value > (int64_t)INT32_MAX + 1) {
+            return BUILD_UNSUPPORTED;
+        }
+    }
+    value = negative ? -value : value;
+    if (value > INT32_MAX || value < INT32_MIN) {
+        return BUILD_UNSUPPORTED;
+    }
+    *doc_id = (int32_t)value;
+    *content_start = (size_t)(tab - line) + 1;
+    return BUILD_OK;
+}
+
+static int index_line(index_t *index, char *line, size_t size)
+{
+    int32_t doc_id;
+    size_t position;
+    int status = parse_doc_id(line, size, &doc_id, &position);
+    if (status != BUILD_OK) {
+        return status;
+    }
+
+    while (position < size) {
+        unsigned char byte = (unsigned char)line[position];
+        /* python reads lone \r as a line break, keep that to python */
+        if (byte >= 0x80 || (byte == '\r' && position + 1 < size
+                             && line[position + 1] != '\n')) {
+            return BUILD_UNSUPPORTED;
+        }
+        if (!word_table[byte]) {
+            position++;
+            continue;
+        }
+        size_t start = position;
+        while (position < size && word_table[(unsigned char)line[position]]) {
+            line[position] = (char)word_table[(unsigned char)line[position]];
+            position++;
+        }
+        posting_t *posting = index_get(index, line + start, position - start);
+        if (!posting || posting_append(posting, doc_id) != BUILD_OK) {
+            return BUILD_NO_MEMORY;
+        }
+    }
+    return BUILD_OK;
+}
+
+static int write_index(index_t *index, const char *out_path)
+{
+    FILE *f_out = fopen(out_path, "wb");
+    if (!f_out) {
+        return BUILD_IO_ERROR;
+    }
+    uint32_t words_count = (uint32_t)index->count;
+    size_t header_size = sizeof(uint32_t);
+    int failed = fwrite(&words_count, sizeof(uint32_t), 1, f_out) != 1;
+    for (size_t i = 0; i < index->count && !failed; i++) {
+        posting_t *posting = &index->postings[i];
+        failed = fwrite(&posting->size, sizeof(uint32_t), 1, f_out) != 1
+                 || fwrite(posting->word, 1, posting->size, f_out)
+                    != posting->size
+                 || fwrite(&posting->count, sizeof(uint32_t), 1, f_out) != 1;
+        header_size += 2 * sizeof(uint32_t) + posting->size;
+    }
+    static const char padding[sizeof(int32_t)] = {0};
+    size_t padding_size = (sizeof(int32_t) - header_size % sizeof(int32_t))
+                          % sizeof(int32_t);
+    if (!failed && padding_size) {
+        failed = fwrite(padding, 1, padding_size, f_out) != padding_size;
+    }
+    for (size_t i = 0; i < index->count && !failed; i++) {
+        posting_t *posting = &index->postings[i];
+        failed = fwrite(posting->documents, sizeof(int32_t), posting->count,
+                        f_out) != posting->count;
+    }
+    if (fclose(f_out) != 0) {
+        failed = 1;
+    }
+    return failed ? BUILD_IO_ERROR : BUILD_OK;
+}
+
+int build_index_file(const char *path, const char *out_path)
+{
+    FILE *f_in = fopen(path, "rb");
+    if (!f_in) {
+        return BUILD_IO_ERROR;
+    }
+    init_word_table();
+
+    index_t index;
+    int status = index_init(&index);
+    char *line = NULL;
+    size_t line_capacity = 0;
+    ssize_t size;
+    while (status == BUILD_OK
+           && (size = getline(&line, &line_capacity, f_in)) != -1) {
+        status = index_line(&index, line, (size_t)size);
+    }
+    if (status == BUILD_OK && ferror(f_in)) {
+        status = BUILD_IO_ERROR;
+    }
+    free(line);
+    fclose(f_in);
+
+    if (status == BUILD_OK) {
+        for (size_t i = 0; i < index.count; i++) {
+            posting_finalize(&index.postings[i]);
+        }
+        status = write_index(&index, out_path);
+    }
+    index_free(&index);
+    return status;
+}
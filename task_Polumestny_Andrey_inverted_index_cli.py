@@ -4,43 +4,311 @@ module provide utils for work with inverted index
 from __future__ import annotations
 
 import argparse
+import ctypes
 import json
+import logging
+import mmap
+import os
 import re
-from struct import pack, unpack, calcsize
+import string
+from struct import pack_into, unpack_from, calcsize
 import sys
+from array import array
+from collections import OrderedDict, defaultdict
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+try:
+    import re2
+except ImportError:
+    re2 = None
+
+try:
+    import sortednp
+except ImportError:
+    sortednp = None
+
+logger = logging.getLogger(__name__)
 
 BASE_DIR = Path(__file__).parent.resolve()
+WORD_RE = re.compile(r"\w+")
+if re2 is not None:
+    # re2 \w is ascii only, so unicode letters and numbers are spelled out
+    WORD_RE = re2.compile(r"[\pL\pN_]+")
+# ascii byte -> lowercase word byte, or zero for separators (same as \W)
+ASCII_WORD_BYTES = (string.ascii_letters + string.digits + '_').encode()
+ASCII_WORD_TABLE = bytes(
+    ord(chr(byte).lower()) if byte in ASCII_WORD_BYTES else 0
+    for byte in range(256)
+)
+UNSIGNED_SIZE = calcsize('I')
+POSTING_SIZE = np.dtype(np.int32).itemsize
+# documents count from which build_inverted_index uses all cpu
+PARALLEL_BUILD_MIN_DOCUMENTS = 100_000
+# posting lists size ratio from which intersect uses binary search
+SEARCH_INTERSECT_RATIO = 10
+# intersections kept by InvertedIndex.query_batch
+QUERY_CACHE_SIZE = 4096
+
+# C builder from _inverted_index.c, python builder is used without it
+try:
+    native = ctypes.CDLL(str(BASE_DIR.joinpath('_inverted_index.so')))
+except OSError:
+    native = None
+else:
+    native.build_index_file.argtypes = (ctypes.c_char_p, ctypes.c_char_p)
+    native.build_index_file.restype = ctypes.c_int
+
+
+def intersect(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """intersect two sorted posting lists"""
+    if sortednp is not None:
+        return sortednp.intersect(left, right)
+    if left.size > right.size:
+        left, right = right, left
+    if right.size < SEARCH_INTERSECT_RATIO * left.size:
+        return np.intersect1d(left, right, assume_unique=True)
+    # filter the much shorter list by binary search in the longer one
+    # instead of concatenating and sorting both lists like intersect1d
+    positions = np.searchsorted(right, left)
+    found = positions < right.size
+    found[found] = right[positions[found]] == left[found]
+    return left[found]
+
+
+def intersect_sorted(left: np.ndarray, right: np.ndarray,
+                     out: np.ndarray) -> int:
+    """write common documents of two sorted posting lists into out
+    and return their count"""
+    left_index = right_index = count = 0
+    while left_index < left.size and right_index < right.size:
+        if left[left_index] < right[right_index]:
+            left_index += 1
+        elif left[left_index] > right[right_index]:
+            right_index += 1
+        else:
+            out[count] = left[left_index]
+            left_index += 1
+            right_index += 1
+            count += 1
+    return count
+
+
+def index_from_json(inverted_index: Dict[str, list]) -> Dict[str, np.ndarray]:
+    """intern words of loaded inverted index and convert their documents
+    to sorted int32 posting lists once, instead of on every query"""
+    return {sys.intern(word): np.sort(np.asarray(documents, dtype=np.int32))
+            for word, documents in inverted_index.items()}
+
+
+def encode_varints(documents: np.ndarray) -> np.ndarray:
+    """encode sorted posting list as varints of gaps between documents,
+    every byte keeps 7 bits of gap and the high bit if more bytes follow"""
+    gaps = np.diff(np.asarray(documents, dtype=np.int64), prepend=0)
+    # first document may be negative, keep int32 bits of it
+    gaps = gaps.astype(np.uint32)
+    sizes = np.ones(gaps.size, dtype=np.int64)
+    for shift in (7, 14, 21, 28):
+        sizes += gaps >= 1 << shift
+    starts = np.cumsum(sizes) - sizes
+    encoded = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for byte_index in range(5):
+        has_byte = sizes > byte_index
+        byte = (gaps[has_byte] >> (7 * byte_index)) & 0x7f
+        byte |= (sizes[has_byte] > byte_index + 1).astype(np.uint32) << 7
+        encoded[starts[has_byte] + byte_index] = byte
+    return encoded
+
+
+def decode_varints(encoded: np.ndarray) -> np.ndarray:
+    """decode posting list written by encode_varints"""
+    encoded = np.asarray(encoded, dtype=np.uint8)
+    if not encoded.size:
+        return np.empty(0, dtype=np.int32)
+    ends = np.flatnonzero(encoded < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    value_index = np.repeat(np.arange(ends.size), ends - starts + 1)
+    shifts = 7 * (np.arange(encoded.size) - starts[value_index])
+    parts = (encoded & 0x7f).astype(np.uint64) << shifts.astype(np.uint64)
+    gaps = np.add.reduceat(parts, starts).astype(np.uint32)
+    return np.cumsum(gaps, dtype=np.uint32).view(np.int32)
+
+
+def posting_to_bytes(documents: np.ndarray) -> bytes:
+    """msgpack hook storing posting list as int32 binary"""
+    return np.asarray(documents, dtype=np.int32).tobytes()
+
+
+def index_from_msgpack(
+        inverted_index: Dict[str, bytes]) -> Dict[str, np.ndarray]:
+    """intern words of loaded inverted index and view their documents
+    as int32 posting lists"""
+    return {sys.intern(word): np.frombuffer(documents, dtype=np.int32)
+            for word, documents in inverted_index.items()}
+
+
+class Postings(dict):
+    """posting lists kept in memory"""
+
+    def documents_count(self, word: str) -> int:
+        """number of documents with the word, zero if word is not found"""
+        documents = self.get(word, None)
+        return 0 if documents is None else len(documents)
+
+
+class VarintPostings(Mapping):
+    """posting lists of varint dump, every posting list is decoded
+    on first access"""
+
+    def __init__(self, header: Dict[str, Tuple[int, int, int]], data):
+        self.header = header
+        self.data = data
+        self.decoded = {}
+
+    def __getitem__(self, word: str) -> np.ndarray:
+        documents = self.decoded.get(word)
+        if documents is None:
+            offset, size, _ = self.header[word]
+            documents = decode_varints(
+                np.frombuffer(self.data, dtype=np.uint8, count=size,
+                              offset=offset))
+            self.decoded[word] = documents
+        return documents
+
+    def __iter__(self):
+        return iter(self.header)
+
+    def documents_count(self, word: str) -> int:
+        """number of documents with the word, zero if word is not found"""
+        return self.header.get(word, (0, 0, 0))[2]
+
+    def __len__(self) -> int:
+        return len(self.header)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+# (path, strategy) -> ((mtime, size, inode), loaded inverted index)
+LOAD_CACHE: Dict[Tuple[str, str], Tuple[tuple, InvertedIndex]] = {}
 
 
 class InvertedIndex:
     """class represented inverted index"""
 
-    def __init__(self, inverted_index: Dict[str, list[str]]):
+    # kernel with intersect_sorted signature, None means numpy/sortednp
+    intersect_kernel = None
+
+    def __init__(self, inverted_index: Dict[str, np.ndarray], buffer=None):
+        # every posting store provides documents_count for query planning
+        if not hasattr(inverted_index, 'documents_count'):
+            inverted_index = Postings(inverted_index)
         self.index = inverted_index
+        # memory map backing the posting views of a binary loaded index
+        self.buffer = buffer
 
     def __eq__(self, other: InvertedIndex):
-        return self.index == other.index
+        if self.index.keys() != other.index.keys():
+            return False
+        return all(np.array_equal(documents, other.index[word])
+                   for word, documents in self.index.items())
 
     def __str__(self):
         return str(self.index)
 
     def query(self, words: List[str]) -> List[int]:
         """Return the list of relevant documents for the given query"""
-        relevant_documents = []
-        for word in words:
-            documents = self.index.get(word, None)
-            if not documents:
+        words = self.plan(words)
+        if not words:
+            return []
+        relevant_documents = self.index[words[0]]
+        for word in words[1:]:
+            relevant_documents = self.intersect(relevant_documents,
+                                                self.index[word])
+            if not relevant_documents.size:
                 return []
-            tmp_relevant_documents = [int(document) for document in documents]
-            if not relevant_documents:
-                relevant_documents = tmp_relevant_documents[:]
+        return relevant_documents.tolist()
+
+    def plan(self, words: List[str]) -> Tuple[str, ...]:
+        """Return query words from the rarest one, so the result shrinks
+        fastest and long posting lists are fetched last if at all, return
+        empty tuple if some word is not found"""
+        counts = {}
+        for word in words:
+            count = self.documents_count(word)
+            if not count:
+                return ()
+            counts[word] = count
+        return tuple(sorted(counts, key=lambda word: (counts[word], word)))
+
+    def documents_count(self, word: str) -> int:
+        """Return number of documents with the word without decoding
+        its posting list"""
+        return self.index.documents_count(word)
+
+    def query_batch(self, queries: List[List[str]]) -> List[List[int]]:
+        """Return the lists of relevant documents for the given queries,
+        intersections of the rarest words are shared between queries"""
+        intersections = OrderedDict()
+        results = []
+        for words in queries:
+            words = self.plan(words)
+            if words:
+                results.append(self.query_planned(words, intersections))
             else:
-                relevant_documents = list(
-                    set(relevant_documents).intersection(
-                        tmp_relevant_documents))
-        return relevant_documents
+                results.append([])
+        return results
+
+    def query_planned(self, words: Tuple[str, ...],
+                      intersections: OrderedDict) -> List[int]:
+        """intersect postings of planned words starting from the longest
+        already known intersection of the rarest words"""
+        known = len(words)
+        while known > 1 and words[:known] not in intersections:
+            known -= 1
+        if known > 1:
+            intersections.move_to_end(words[:known])
+            relevant_documents = intersections[words[:known]]
+        else:
+            relevant_documents = self.index[words[0]]
+        for size in range(known + 1, len(words) + 1):
+            if not relevant_documents.size:
+                break
+            relevant_documents = self.intersect(relevant_documents,
+                                                self.index[words[size - 1]])
+            intersections[words[:size]] = relevant_documents
+            if len(intersections) > QUERY_CACHE_SIZE:
+                intersections.popitem(last=False)
+        return relevant_documents.tolist()
+
+    def intersect(self, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+        """intersect two sorted posting lists with the active kernel"""
+        if self.intersect_kernel is None:
+            return intersect(left, right)
+        out = np.empty(min(left.size, right.size), dtype=np.int32)
+        return out[:self.intersect_kernel(left, right, out)]
+
+    @classmethod
+    def activate_numba(cls) -> None:
+        """compile intersect_sorted with numba and use it in query"""
+        if numba is None:
+            raise ImportError('numba is required to activate numba kernel')
+        cls.intersect_kernel = staticmethod(
+            numba.njit(cache=True)(intersect_sorted))
 
     def dump(self, filepath: str, method='struct') -> None:
         """save inverted index in file"""
@@ -49,36 +317,98 @@ class InvertedIndex:
             file = BASE_DIR.joinpath(file)
         if method == 'json':
             self.json_dump(file)
+        elif method == 'varint':
+            self.varint_dump(file)
+        elif method == 'msgpack':
+            self.msgpack_dump(file)
         else:
             self.struct_dump(file)
 
     def json_dump(self, file: str) -> None:
         """save inverted index in file with json algorithm"""
         with open(file, 'w') as f_out:
-            json.dump(self.index, f_out)
-
-    def struct_dump(self, file:str) -> None:
-        """save inverted index if file with struct algorithm"""
-        pairs = {}
-        documents_id = []
+            # lazily decoded stores are mappings, not dicts json can write
+            json.dump(dict(self.index), f_out, default=np.ndarray.tolist)
+
+    def msgpack_dump(self, file: str) -> None:
+        """save inverted index in file with msgpack, posting lists are
+        stored as int32 binaries"""
+        if msgpack is None:
+            raise ImportError('msgpack is required for msgpack strategy')
         with open(file, 'wb') as f_out:
-            for word, documents in self.index.items():
-                pairs[word] = len(documents)
-                for doc_id in documents:
-                    documents_id.append(doc_id)
-            header = json.dumps(pairs).encode('utf8')
-            # header = json.dumps(pairs).encode('utf8')
-            print(f'{header=}', file=sys.stderr)
-            meta = len(header)
-            print(f'{meta=}', file=sys.stderr)
-            print(f'{type(meta)=}', file=sys.stderr)
-            print(f'{documents_id=}', file=sys.stderr)
-            f_out.write(pack('I', meta))
-            f_out.write(pack(f'{meta}s', header))
-            f_out.write(pack('H', ))
-            # f_out.write(pack('H', bytes(str(documents_id), encoding='utf8')))
-            # f_out.write(pack('IPs', meta, header, bytes(str(documents_id), encoding='utf8')))
-            # f_out.write(pack('Iss', meta, header, str(documents_id)))
+            msgpack.pack(dict(self.index), f_out, use_bin_type=True,
+                         default=posting_to_bytes)
+
+    def struct_dump(self, file: str) -> None:
+        """save inverted index in file with struct algorithm
+
+        layout: number of words, then (word size, word, documents count)
+        for every word, then all posting lists as one int32 block
+        """
+        words = [word.encode('utf8') for word in self.index]
+        postings = [np.asarray(documents, dtype=np.int32)
+                    for documents in self.index.values()]
+        header_size = UNSIGNED_SIZE + sum(
+            2 * UNSIGNED_SIZE + len(word) for word in words)
+        # keep posting block aligned for zero-copy int32 views
+        header_size += -header_size % POSTING_SIZE
+        documents_count = sum(len(documents) for documents in postings)
+        buffer = bytearray(header_size)
+
+        pack_into('I', buffer, 0, len(words))
+        offset = UNSIGNED_SIZE
+        for word, documents in zip(words, postings):
+            pack_into(f'I{len(word)}s', buffer, offset, len(word), word)
+            offset += UNSIGNED_SIZE + len(word)
+            pack_into('I', buffer, offset, len(documents))
+            offset += UNSIGNED_SIZE
+
+        # replace the file instead of rewriting it in place, so indexes
+        # already mapped from the old file keep valid postings
+        tmp_file = f'{file}.tmp'
+        logger.debug('dump %d words with %d documents',
+                     len(words), documents_count)
+        with open(tmp_file, 'wb') as f_out:
+            f_out.write(buffer)
+            if postings:
+                # posting block is written by one C level fwrite
+                np.concatenate(postings).tofile(f_out)
+        os.replace(tmp_file, file)
+
+    def varint_dump(self, file: str) -> None:
+        """save inverted index in file with delta varint encoded postings
+
+        layout: number of words, then (word size, word, documents count,
+        encoded size) for every word, then all encoded posting lists
+        """
+        words = [word.encode('utf8') for word in self.index]
+        postings = [encode_varints(documents)
+                    for documents in self.index.values()]
+        header_size = UNSIGNED_SIZE + sum(
+            3 * UNSIGNED_SIZE + len(word) for word in words)
+        buffer = bytearray(
+            header_size + sum(len(encoded) for encoded in postings))
+
+        pack_into('I', buffer, 0, len(words))
+        offset = UNSIGNED_SIZE
+        for word, documents, encoded in zip(words, self.index.values(),
+                                            postings):
+            pack_into(f'I{len(word)}s', buffer, offset, len(word), word)
+            offset += UNSIGNED_SIZE + len(word)
+            pack_into('II', buffer, offset, len(documents), len(encoded))
+            offset += 2 * UNSIGNED_SIZE
+        posting_block = np.frombuffer(buffer, dtype=np.uint8,
+                                      offset=header_size)
+        offset = 0
+        for encoded in postings:
+            posting_block[offset:offset + len(encoded)] = encoded
+            offset += len(encoded)
+
+        tmp_file = f'{file}.tmp'
+        logger.debug('dump %d words in %d bytes', len(words), len(buffer))
+        with open(tmp_file, 'wb') as f_out:
+            f_out.write(buffer)
+        os.replace(tmp_file, file)
 
     @classmethod
     def load(cls, filepath: str, strategy='struct') -> InvertedIndex:
@@ -86,33 +416,96 @@ class InvertedIndex:
         file = Path(filepath)
         if not file.is_absolute():
             file = BASE_DIR.joinpath(file)
+        file = file.resolve()
+        stat = file.stat()
+        signature = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        key = (str(file), strategy)
+        cached = LOAD_CACHE.get(key)
+        if cached and cached[0] == signature:
+            return cached[1]
+
         if strategy == 'json':
-            cls.load_from_json(file)
+            inverted_index = cls.load_from_json(file)
+        elif strategy == 'varint':
+            inverted_index = cls.load_from_varint(file)
+        elif strategy == 'msgpack':
+            inverted_index = cls.load_from_msgpack(file)
         else:
-            cls.load_from_binary(file)
+            inverted_index = cls.load_from_binary(file)
+        LOAD_CACHE[key] = (signature, inverted_index)
+        return inverted_index
 
     @classmethod
     def load_from_json(cls, file):
         with open(file, 'r') as f_in:
-            inverted_index = json.load(f_in)
-            print(inverted_index, file=sys.stderr)
+            inverted_index = json.load(f_in, object_hook=index_from_json)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug('loaded inverted index %r', inverted_index)
+        inverted_index_instance = InvertedIndex(inverted_index)
+        return inverted_index_instance
+
+    @classmethod
+    def load_from_msgpack(cls, file):
+        if msgpack is None:
+            raise ImportError('msgpack is required for msgpack strategy')
+        with open(file, 'rb') as f_in:
+            inverted_index = msgpack.unpack(f_in, raw=False,
+                                            object_hook=index_from_msgpack)
         inverted_index_instance = InvertedIndex(inverted_index)
         return inverted_index_instance
 
     @classmethod
     def load_from_binary(cls, file):
         with open(file, 'rb') as f_in:
-            data = f_in.read()
-            print(data)
-            unsigned_index = calcsize('I')
-            meta, = unpack('I', data[:4])
-            print(meta)
-            print(sys.getsizeof(data[4:4+meta]))
-            header, = unpack(f'{meta}s', data[4:4+meta])
-            print(header)
-            # print(f'{meta=}', file=sys.stderr)
-            # print(f'{header=}', file=sys.stderr)
-            # print(f'{documents_id=}', file=sys.stderr)
+            data = mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ)
+        words_count, = unpack_from('I', data, 0)
+        offset = UNSIGNED_SIZE
+        header = []
+        for _ in range(words_count):
+            word_size, = unpack_from('I', data, offset)
+            offset += UNSIGNED_SIZE
+            word = data[offset:offset + word_size].decode('utf8')
+            word = sys.intern(word)
+            offset += word_size
+            documents_count, = unpack_from('I', data, offset)
+            offset += UNSIGNED_SIZE
+            header.append((word, documents_count))
+        offset += -offset % POSTING_SIZE
+
+        inverted_index = {}
+        for word, documents_count in header:
+            inverted_index[word] = np.frombuffer(
+                data, dtype=np.int32, count=documents_count, offset=offset)
+            offset += POSTING_SIZE * documents_count
+        logger.debug('loaded %d words from %d bytes', words_count, len(data))
+        inverted_index_instance = InvertedIndex(inverted_index, buffer=data)
+        return inverted_index_instance
+
+    @classmethod
+    def load_from_varint(cls, file):
+        with open(file, 'rb') as f_in:
+            data = mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ)
+        words_count, = unpack_from('I', data, 0)
+        offset = UNSIGNED_SIZE
+        sizes = []
+        for _ in range(words_count):
+            word_size, = unpack_from('I', data, offset)
+            offset += UNSIGNED_SIZE
+            word = data[offset:offset + word_size].decode('utf8')
+            word = sys.intern(word)
+            offset += word_size
+            documents_count, encoded_size = unpack_from('II', data, offset)
+            offset += 2 * UNSIGNED_SIZE
+            sizes.append((word, documents_count, encoded_size))
+
+        header = {}
+        for word, documents_count, encoded_size in sizes:
+            header[word] = (offset, encoded_size, documents_count)
+            offset += encoded_size
+        logger.debug('loaded %d words from %d bytes', words_count, len(data))
+        inverted_index_instance = InvertedIndex(VarintPostings(header, data),
+                                                buffer=data)
+        return inverted_index_instance
 
 
 def load_documents(filepath: str) -> Dict[int, str]:
@@ -126,22 +519,124 @@ def load_documents(filepath: str) -> Dict[int, str]:
     in_memory_doc = {}
     with open(file, 'r') as f_in:
         for line in f_in:
-            doc_id, content = line.lower().split("\t", 1)
+            doc_id, content = line.split("\t", 1)
             doc_id = int(doc_id)
-            in_memory_doc[doc_id] = content.strip()
+            in_memory_doc[doc_id] = content.strip().lower()
     return in_memory_doc
 
 
-def build_inverted_index(documents: Dict[int, str]) -> InvertedIndex:
-    """build inverted index from a document"""
+def tokenize(text: str) -> List[str]:
+    """split text to lowercase words, words are interned so repeated
+    words share one string object"""
+    if text.isascii():
+        words = text.encode('ascii').translate(ASCII_WORD_TABLE).split(b'\0')
+        return [sys.intern(word.decode('ascii')) for word in words if word]
+    return [sys.intern(match.group().lower())
+            for match in WORD_RE.finditer(text)]
+
+
+def build_inverted_index(documents: Dict[int, str],
+                         workers: int = None) -> InvertedIndex:
+    """build inverted index from a document, big documents are split to
+    shards built in parallel by workers processes"""
+    if workers is None:
+        workers = 1
+        if len(documents) >= PARALLEL_BUILD_MIN_DOCUMENTS:
+            workers = os.cpu_count() or 1
+    if workers <= 1:
+        inv_index = defaultdict(lambda: array('i'))
+        for key, value in documents.items():
+            index_document(inv_index, key, value)
+        return make_inverted_index(inv_index)
+
+    items = list(documents.items())
+    shard_size = len(items) // workers + 1
+    shards = [items[start:start + shard_size]
+              for start in range(0, len(items), shard_size)]
+    shard_postings = defaultdict(list)
+    with ProcessPoolExecutor(workers) as executor:
+        for shard_index in executor.map(build_shard, shards):
+            for word, documents_id in shard_index.items():
+                shard_postings[word].append(
+                    np.frombuffer(documents_id, dtype=np.int32))
+
+    # shards cover consecutive documents, so postings of ordered
+    # documents only have to be concatenated
+    keys = list(documents)
+    ordered = all(left < right for left, right in zip(keys, keys[1:]))
     inv_index = {}
-    for key, value in documents.items():
-        for word in re.split(r"\W+", value):
-            if word not in inv_index:
-                inv_index[word] = [key]
-            elif word in inv_index and key not in inv_index[word]:
-                inv_index[word].append(key)
-    inv_index_instance = InvertedIndex(inv_index)
+    for word, parts in shard_postings.items():
+        documents_id = np.concatenate(parts)
+        inv_index[word] = documents_id if ordered else np.sort(documents_id)
+    return InvertedIndex(inv_index)
+
+
+def build_shard(documents: List[Tuple[int, str]]) -> Dict[str, array]:
+    """build posting lists for a shard of documents"""
+    inv_index = defaultdict(lambda: array('i'))
+    for key, value in documents:
+        index_document(inv_index, key, value)
+    return dict(inv_index)
+
+
+def index_document(inv_index: Dict[str, array], doc_id: int,
+                   content: str) -> None:
+    """append document to posting lists of its words"""
+    for word in tokenize(content):
+        documents_id = inv_index[word]
+        # a word repeated in the document can only hit the last document
+        if not documents_id or documents_id[-1] != doc_id:
+            documents_id.append(doc_id)
+
+
+def stream_build(filepath: str) -> InvertedIndex:
+    """build inverted index while reading documents from file"""
+    file = Path(filepath)
+    if not file.is_absolute():
+        file = BASE_DIR.joinpath(file)
+
+    if not file.exists():
+        raise FileNotFoundError
+    inv_index = defaultdict(lambda: array('i'))
+    with open(file, 'r') as f_in:
+        for line in f_in:
+            doc_id, content = line.split("\t", 1)
+            index_document(inv_index, int(doc_id), content)
+    return make_inverted_index(inv_index)
+
+
+def native_build(dataset_filepath: str, output_filepath: str) -> bool:
+    """build struct dump of inverted index with C builder,
+    return False if builder is not available or can't handle dataset"""
+    if native is None:
+        return False
+    dataset = Path(dataset_filepath)
+    if not dataset.is_absolute():
+        dataset = BASE_DIR.joinpath(dataset)
+    output = Path(output_filepath)
+    if not output.is_absolute():
+        output = BASE_DIR.joinpath(output)
+
+    tmp_file = Path(f'{output}.tmp')
+    status = native.build_index_file(os.fsencode(dataset),
+                                     os.fsencode(tmp_file))
+    if status != 0:
+        tmp_file.unlink(missing_ok=True)
+        return False
+    os.replace(tmp_file, output)
+    return True
+
+
+def make_inverted_index(inv_index: Dict[str, array]) -> InvertedIndex:
+    """convert collected document arrays to sorted posting lists"""
+    postings = {}
+    for word, documents_id in inv_index.items():
+        documents_id = np.frombuffer(documents_id, dtype=np.int32)
+        # documents out of order or repeated in dataset
+        if np.any(documents_id[1:] <= documents_id[:-1]):
+            documents_id = np.unique(documents_id)
+        postings[word] = documents_id
+    inv_index_instance = InvertedIndex(postings)
     return inv_index_instance
 
 
@@ -158,7 +653,7 @@ def cli():
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
     build_parser.add_argument(
-        '--strategy', choices=('json', 'struct'),
+        '--strategy', choices=('json', 'struct', 'varint', 'msgpack'),
         default='struct',
         help='strategy to store inverted index'
     )
@@ -198,26 +693,32 @@ def build_callback(arguments):
 
 
 def build(dataset_filepath, output_filepath):
-    documents = load_documents(dataset_filepath)
-    inverted_index_instance = build_inverted_index(documents)
+    if native_build(dataset_filepath, output_filepath):
+        logger.info('build completed in %s', output_filepath)
+        return
+    inverted_index_instance = stream_build(dataset_filepath)
     inverted_index_instance.dump(output_filepath)
-    print(f'build completed in {output_filepath}', file=sys.stderr)
+    logger.info('build completed in %s', output_filepath)
 
 
 def query_callback(arguments):
-    print(arguments, file=sys.stderr)
+    logger.debug('%s', arguments)
     if arguments.query_file:
         query_from_file(arguments.inverted_index_path, arguments.query_file)
     else:
         query_from_list(arguments.inverted_index_path, arguments.query)
-    print('query completed successfully', file=sys.stderr)
+    logger.info('query completed successfully')
 
 
 def query_from_file(inverted_index_path, query_file):
     inverted_index = InvertedIndex.load(inverted_index_path)
+    # split() without separator drops the newline and repeated spaces
+    split = str.split
+    queries = []
     for words in query_file:
         print(words, file=sys.stderr)
-        documents = inverted_index.query(words.split(' '))
+        queries.append(split(words))
+    for documents in inverted_index.query_batch(queries):
         if documents:
             print(','.join([str(doc_id) for doc_id in documents]))
         else:
@@ -226,8 +727,7 @@ def query_from_file(inverted_index_path, query_file):
 
 def query_from_list(inverted_index_path, query):
     inverted_index = InvertedIndex.load(inverted_index_path)
-    for words in query:
-        documents = inverted_index.query(words)
+    for documents in inverted_index.query_batch(query):
         if documents:
             print(','.join([str(doc_id) for doc_id in documents]))
         else:
@@ -1,18 +1,21 @@
 """
 test for inverted_index module
 """
+import io
+import re
 from textwrap import dedent
 
+import numpy as np
 import pytest
 
 
 import task_Polumestny_Andrey_inverted_index_cli as inverted_index
 
 
-@pytest.fixture(ids='small_dataset')
-def small_doc(tmpdir):
+@pytest.fixture(ids='small_dataset_file')
+def small_dataset(tmpdir):
     """
-    fixture load in memory small document
+    fixture write small document to file
     """
     data = dedent("""\
     12	Anarchism         Anarchism is often defined as topic test
@@ -20,6 +23,14 @@ def small_doc(tmpdir):
     """)
     small_dataset = tmpdir.join('small_dataset')
     small_dataset.write(data)
+    return small_dataset
+
+
+@pytest.fixture(ids='small_dataset')
+def small_doc(small_dataset):
+    """
+    fixture load in memory small document
+    """
     documents = inverted_index.load_documents(small_dataset)
     return documents
 
@@ -51,6 +62,36 @@ def test_load_doc():
     assert isinstance(file_dump, dict), err_msg
 
 
+@pytest.mark.parametrize(
+    'text',
+    [
+        pytest.param('Anarchism   is often_defined, as 2 TOPIC\n', id='ascii'),
+        pytest.param('Анархизм   is often_defined, as 2 ТЕМА\n',
+                     id='non_ascii'),
+    ]
+)
+def test_tokenize_same_as_regex(text):
+    """
+    test tokenize return same words as word regex over lowercase text
+    """
+    expected = inverted_index.WORD_RE.findall(text.lower())
+    words = inverted_index.tokenize(text)
+    err_msg = f'wrong words, expected {expected}, got {words}'
+    assert words == expected, err_msg
+
+
+def test_word_regex_same_as_re(small_dataset):
+    """
+    test word regex (re2 when installed) return same words as re
+    """
+    for line in small_dataset.readlines():
+        expected = re.findall(r"\w+", line)
+        words = [match.group()
+                 for match in inverted_index.WORD_RE.finditer(line)]
+        err_msg = f'wrong words, expected {expected}, got {words}'
+        assert words == expected, err_msg
+
+
 def test_build_inverted_index_return(small_doc):
     inv_index = inverted_index.build_inverted_index(small_doc)
     err_msg = (f'build_inverted_index should return InvertedIndex,'
@@ -58,6 +99,51 @@ def test_build_inverted_index_return(small_doc):
     assert isinstance(inv_index, inverted_index.InvertedIndex), err_msg
 
 
+def test_build_inverted_index_sorted_postings(small_doc):
+    """
+    test posting lists are stored as sorted int32 arrays
+    """
+    inv_index = inverted_index.build_inverted_index(small_doc)
+    documents = inv_index.index['topic']
+    err_msg = f'posting list should be sorted int32 array, got {documents!r}'
+    assert documents.dtype == np.int32, err_msg
+    assert documents.tolist() == [12, 25], err_msg
+
+
+def test_parallel_build_equal_to_build_inverted_index(small_doc,
+                                                     small_inverted_index):
+    """
+    test build_inverted_index with several workers builds same index
+    """
+    inv_index = inverted_index.build_inverted_index(small_doc, workers=2)
+    err_msg = 'parallel build return different inverted index'
+    assert inv_index == small_inverted_index, err_msg
+
+
+def test_stream_build_equal_to_build_inverted_index(small_dataset,
+                                                   small_inverted_index):
+    """
+    test stream_build builds same index as build_inverted_index
+    """
+    inv_index = inverted_index.stream_build(small_dataset)
+    err_msg = 'stream_build return different inverted index'
+    assert inv_index == small_inverted_index, err_msg
+
+
+@pytest.mark.skipif(inverted_index.native is None,
+                    reason='_inverted_index.so is not built')
+def test_native_build_equal_to_stream_build(small_dataset, tmpdir):
+    """
+    test C builder dump same index as stream_build
+    """
+    file = tmpdir.join('inverted_index_dump.bin')
+    assert inverted_index.native_build(small_dataset, file)
+    loaded_inv_index = inverted_index.InvertedIndex.load(file, 'struct')
+    err_msg = 'C builder return different inverted index'
+    assert loaded_inv_index == inverted_index.stream_build(small_dataset), \
+        err_msg
+
+
 def test_build_inverted_index_for_same_doc_equal(small_doc):
     """
     test __eq__ method of InvertedIndex
@@ -85,7 +171,7 @@ def test_load_doc_count_of_topic():
         pytest.param(['anarchism'], [12], id='one_document_matching'),
         pytest.param(['topic'], [12, 25], id='two_document_matching'),
         pytest.param(['topic', 'test'],
-                     [25, 12],
+                     [12, 25],
                      id='list_of_words_in_two_document_matching'),
         pytest.param(['topic', 'something'],
                      [],
@@ -102,6 +188,72 @@ def test_query_inverted_index(small_inverted_index, words, answer):
     assert documents == answer, err_msg
 
 
+@pytest.mark.parametrize(
+    'left, right, answer',
+    [
+        pytest.param([3, 12, 25], [1, 12, 25, 40, 41], [12, 25],
+                     id='common_documents'),
+        pytest.param([1, 12, 25, 40, 41], [3, 12, 25], [12, 25],
+                     id='longer_left'),
+        pytest.param([50, 60], [1, 12, 25], [], id='after_last_document'),
+        pytest.param([12, 13, 99], list(range(0, 40, 2)), [12],
+                     id='skewed_sizes'),
+        pytest.param([], [1, 12], [], id='empty'),
+    ]
+)
+def test_intersect(left, right, answer):
+    """
+    test intersect of sorted posting lists
+    """
+    documents = inverted_index.intersect(np.asarray(left, dtype=np.int32),
+                                         np.asarray(right, dtype=np.int32))
+    err_msg = f'wrong documents found, expected {answer}, got {documents}'
+    assert documents.tolist() == answer, err_msg
+
+
+def test_query_batch_same_as_query(small_inverted_index):
+    """
+    test InvertedIndex query_batch return same documents as query
+    """
+    queries = [
+        ['topic', 'test'],
+        ['test', 'topic', 'anarchism'],
+        ['topic', 'test', 'another'],
+        ['anarchism', 'another'],
+        ['topic', 'something'],
+        ['topic'],
+        [],
+    ]
+    expected = [small_inverted_index.query(words) for words in queries]
+    documents = small_inverted_index.query_batch(queries)
+    err_msg = f'wrong documents found, expected {expected}, got {documents}'
+    assert documents == expected, err_msg
+
+
+def test_query_with_python_kernel(small_inverted_index, monkeypatch):
+    """
+    test query with pure python intersection kernel
+    """
+    monkeypatch.setattr(inverted_index.InvertedIndex, 'intersect_kernel',
+                        staticmethod(inverted_index.intersect_sorted))
+    documents = small_inverted_index.query(['topic', 'test'])
+    err_msg = f'wrong documents found, expected [12, 25], got {documents}'
+    assert documents == [12, 25], err_msg
+
+
+def test_query_with_numba_kernel(small_inverted_index, monkeypatch):
+    """
+    test query after numba kernel activation
+    """
+    pytest.importorskip('numba')
+    monkeypatch.setattr(inverted_index.InvertedIndex, 'intersect_kernel',
+                        None)
+    inverted_index.InvertedIndex.activate_numba()
+    documents = small_inverted_index.query(['topic', 'test'])
+    err_msg = f'wrong documents found, expected [12, 25], got {documents}'
+    assert documents == [12, 25], err_msg
+
+
 def test_dump_inverted_index(small_inverted_index, tmpdir):
     """
     test InvertedIndex dump method
@@ -126,6 +278,170 @@ def test_inverted_index_load(small_inverted_index):
     assert inv_index == loaded_inv_index, err_msg
 
 
+def test_struct_dump_load_roundtrip(small_inverted_index, tmpdir):
+    """
+    test InvertedIndex binary dump can be loaded back
+    """
+    file = tmpdir.join('inverted_index_dump.bin')
+    small_inverted_index.dump(file, 'struct')
+    loaded_inv_index = inverted_index.InvertedIndex.load(file, 'struct')
+
+    err_msg = 'loaded inverted index not equal with dumped one'
+    assert small_inverted_index == loaded_inv_index, err_msg
+    assert loaded_inv_index.query(['topic', 'test']) == [12, 25]
+
+
+def test_varint_dump_load_roundtrip(small_inverted_index, tmpdir):
+    """
+    test InvertedIndex varint dump can be loaded back
+    """
+    file = tmpdir.join('inverted_index_dump.varint')
+    small_inverted_index.dump(file, 'varint')
+    loaded_inv_index = inverted_index.InvertedIndex.load(file, 'varint')
+
+    err_msg = 'loaded inverted index not equal with dumped one'
+    assert small_inverted_index == loaded_inv_index, err_msg
+    assert loaded_inv_index.query(['topic', 'test']) == [12, 25]
+
+
+@pytest.mark.parametrize('strategy', ['struct', 'json', 'varint'])
+def test_documents_count(small_inverted_index, tmpdir, strategy):
+    """
+    test InvertedIndex documents_count for every posting store
+    """
+    file = tmpdir.join(f'inverted_index_dump.{strategy}')
+    small_inverted_index.dump(file, strategy)
+    loaded_inv_index = inverted_index.InvertedIndex.load(file, strategy)
+
+    for inv_index in (small_inverted_index, loaded_inv_index):
+        assert inv_index.documents_count('topic') == 2
+        assert inv_index.documents_count('something') == 0
+
+
+def test_query_skip_postings_after_empty_result(small_inverted_index,
+                                                tmpdir):
+    """
+    test query does not decode posting lists once result is empty
+    """
+    file = tmpdir.join('inverted_index_dump.varint')
+    small_inverted_index.dump(file, 'varint')
+    loaded_inv_index = inverted_index.InvertedIndex.load(file, 'varint')
+
+    documents = loaded_inv_index.query(['topic', 'another', 'anarchism'])
+    assert documents == [], f'wrong documents found, got {documents}'
+    err_msg = 'longest posting list decoded after empty intersection'
+    assert 'topic' not in loaded_inv_index.index.decoded, err_msg
+
+
+def test_varint_load_json_dump_roundtrip(small_inverted_index, tmpdir):
+    """
+    test InvertedIndex loaded from varint dump can be dumped to json
+    """
+    varint_file = tmpdir.join('inverted_index_dump.varint')
+    small_inverted_index.dump(varint_file, 'varint')
+    varint_inv_index = inverted_index.InvertedIndex.load(varint_file, 'varint')
+    json_file = tmpdir.join('inverted_index_dump.json')
+    varint_inv_index.dump(json_file, 'json')
+    loaded_inv_index = inverted_index.InvertedIndex.load(json_file, 'json')
+
+    err_msg = 'loaded inverted index not equal with dumped one'
+    assert small_inverted_index == loaded_inv_index, err_msg
+
+
+@pytest.mark.parametrize(
+    'documents',
+    [
+        pytest.param([], id='empty'),
+        pytest.param([12, 25], id='small_gaps'),
+        pytest.param([-2 ** 31, -1, 0, 127, 128, 16384, 2 ** 31 - 1],
+                     id='int32_bounds'),
+    ]
+)
+def test_varints_roundtrip(documents):
+    """
+    test decode_varints restore documents encoded by encode_varints
+    """
+    documents = np.asarray(documents, dtype=np.int32)
+    encoded = inverted_index.encode_varints(documents)
+    decoded = inverted_index.decode_varints(encoded)
+    err_msg = f'wrong documents decoded, expected {documents}, got {decoded}'
+    assert decoded.tolist() == documents.tolist(), err_msg
+
+
+def test_msgpack_dump_load_roundtrip(small_inverted_index, tmpdir):
+    """
+    test InvertedIndex msgpack dump can be loaded back
+    """
+    pytest.importorskip('msgpack')
+    file = tmpdir.join('inverted_index_dump.msgpack')
+    small_inverted_index.dump(file, 'msgpack')
+    loaded_inv_index = inverted_index.InvertedIndex.load(file, 'msgpack')
+
+    err_msg = 'loaded inverted index not equal with dumped one'
+    assert small_inverted_index == loaded_inv_index, err_msg
+    assert loaded_inv_index.query(['topic', 'test']) == [12, 25]
+
+
+def test_varint_load_msgpack_dump_roundtrip(small_inverted_index, tmpdir):
+    """
+    test InvertedIndex loaded from varint dump can be dumped to msgpack
+    """
+    pytest.importorskip('msgpack')
+    varint_file = tmpdir.join('inverted_index_dump.varint')
+    small_inverted_index.dump(varint_file, 'varint')
+    varint_inv_index = inverted_index.InvertedIndex.load(varint_file, 'varint')
+    msgpack_file = tmpdir.join('inverted_index_dump.msgpack')
+    varint_inv_index.dump(msgpack_file, 'msgpack')
+    loaded_inv_index = inverted_index.InvertedIndex.load(msgpack_file,
+                                                         'msgpack')
+
+    err_msg = 'loaded inverted index not equal with dumped one'
+    assert small_inverted_index == loaded_inv_index, err_msg
+
+
+def test_json_load_postings_are_arrays(small_inverted_index, tmpdir):
+    """
+    test InvertedIndex json load convert posting lists to int32 arrays
+    """
+    file = tmpdir.join('inverted_index_dump.json')
+    small_inverted_index.dump(file, 'json')
+    loaded_inv_index = inverted_index.InvertedIndex.load(file, 'json')
+
+    err_msg = 'loaded inverted index not equal with dumped one'
+    assert small_inverted_index == loaded_inv_index, err_msg
+    documents = loaded_inv_index.index['topic']
+    err_msg = f'posting list should be int32 array, got {documents!r}'
+    assert documents.dtype == np.int32, err_msg
+
+
+def test_load_cached_until_file_changed(small_inverted_index, tmpdir):
+    """
+    test InvertedIndex load reuse loaded index while file is not changed
+    """
+    file = tmpdir.join('inverted_index_dump.bin')
+    small_inverted_index.dump(file, 'struct')
+    loaded_inv_index = inverted_index.InvertedIndex.load(file, 'struct')
+    assert inverted_index.InvertedIndex.load(file, 'struct') \
+        is loaded_inv_index, 'same file loaded twice'
+
+    small_inverted_index.dump(file, 'struct')
+    assert inverted_index.InvertedIndex.load(file, 'struct') \
+        is not loaded_inv_index, 'changed file taken from cache'
+
+
+def test_query_from_file_split_words(small_inverted_index, tmpdir, capsys):
+    """
+    test query_from_file ignore line endings and repeated spaces
+    """
+    file = tmpdir.join('inverted_index_dump.bin')
+    small_inverted_index.dump(file, 'struct')
+    query_file = io.StringIO('topic test\n\nanarchism  topic\nanother\n')
+    inverted_index.query_from_file(inverted_index_path=file,
+                                   query_file=query_file)
+    captured = capsys.readouterr()
+    assert captured.out.splitlines() == ['12,25', '', '12', '25']
+
+
 # @pytest.mark.parametrize()
 def test_cli_query_from_file(capsys):
     query_file = 'datasets/query_utf8.txt'